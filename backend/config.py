@@ -4,12 +4,30 @@ Imported by rag.py, documents.py, and lambda_function.py.
 """
 import boto3
 import os
+from botocore.config import Config
 
 REGION = os.environ.get('AWS_REGION', 'us-east-1')
 
-bedrock_runtime = boto3.client('bedrock-runtime', region_name=REGION)
-s3_client       = boto3.client('s3',              region_name=REGION)
-dynamodb        = boto3.resource('dynamodb',       region_name=REGION)
+# Clients live across warm invocations; TCP keep-alive stops idle pooled
+# connections from being dropped between requests, so TLS handshakes are
+# amortised.
+BEDROCK_CONFIG = Config(
+    max_pool_connections=50,
+    connect_timeout=5,
+    read_timeout=60,
+    tcp_keepalive=True,
+    retries={'max_attempts': 5, 'mode': 'adaptive'},
+)
+AWS_CONFIG = Config(
+    connect_timeout=2,
+    read_timeout=10,
+    tcp_keepalive=True,
+    retries={'max_attempts': 3, 'mode': 'adaptive'},
+)
+
+bedrock_runtime = boto3.client('bedrock-runtime', region_name=REGION, config=BEDROCK_CONFIG)
+s3_client       = boto3.client('s3',              region_name=REGION, config=AWS_CONFIG)
+dynamodb        = boto3.resource('dynamodb',       region_name=REGION, config=AWS_CONFIG)
 
 vault_bucket          = os.environ.get('KNOWLEDGE_VAULT_BUCKET')
 table_name            = os.environ.get('USER_USAGE_TABLE')
@@ -2,7 +2,8 @@
 Document Processor Lambda
 =========================
 Triggered by S3 ObjectCreated events when a user uploads a file to the
-knowledge-vault bucket.  The function:
+knowledge-vault bucket, and by SNS when an async Textract job it started
+completes.  The function:
 
 1. Downloads the object from S3.
 2. Extracts plain text (TXT / CSV natively; PDF & DOCX via Amazon Textract).
@@ -15,31 +16,89 @@ knowledge-vault bucket.  The function:
 Environment variables (set by Terraform):
   CHUNKS_TABLE          – DynamoDB table name for document chunks
   KNOWLEDGE_VAULT_BUCKET – S3 bucket name (used for Textract async jobs)
+  TEXTRACT_SNS_TOPIC_ARN – SNS topic Textract notifies on job completion
+  TEXTRACT_SNS_ROLE_ARN  – role Textract assumes to publish to that topic
   AWS_REGION            – region (injected automatically by Lambda runtime)
+
+When the two TEXTRACT_SNS_* variables are unset, async Textract jobs are
+polled in-process instead.
 """
 
+import bisect
+import codecs
+import hashlib
 import json
+import math
 import os
 import re
+import struct
+import threading
 import time
 import urllib.parse
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 import boto3
+from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import Binary
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 # ---------------------------------------------------------------------------
 # AWS clients
 # ---------------------------------------------------------------------------
+# Every client and the status Table resource is built here, during the
+# Lambda init phase, so warm invocations reuse them along with their
+# connection pools.  Record workers build their chunks Table on first use.
 REGION = os.environ.get("AWS_REGION", "us-east-1")
 
-s3_client        = boto3.client("s3",              region_name=REGION)
-bedrock_runtime  = boto3.client("bedrock-runtime", region_name=REGION)
-textract_client  = boto3.client("textract",        region_name=REGION)
-dynamodb         = boto3.resource("dynamodb",       region_name=REGION)
+# Keep-alive pool sized above EMBEDDING_CONCURRENCY so concurrent embeddings
+# reuse TLS connections; adaptive retries absorb Bedrock throttling.
+BEDROCK_CONFIG = Config(
+    max_pool_connections=50,
+    connect_timeout=5,
+    read_timeout=60,
+    tcp_keepalive=True,
+    retries={"max_attempts": 5, "mode": "adaptive"},
+)
+
+# Textract throttles GetDocumentTextDetection aggressively; retry adaptively
+TEXTRACT_CONFIG = Config(
+    tcp_keepalive=True,
+    retries={"max_attempts": 5, "mode": "adaptive"},
+)
+
+# TCP keep-alive stops idle pooled connections being dropped between warm
+# invocations, so their TLS handshakes are not repeated
+AWS_CONFIG = Config(tcp_keepalive=True)
+
+s3_client        = boto3.client("s3",              region_name=REGION, config=AWS_CONFIG)
+bedrock_runtime  = boto3.client("bedrock-runtime", region_name=REGION, config=BEDROCK_CONFIG)
+textract_client  = boto3.client("textract",        region_name=REGION, config=TEXTRACT_CONFIG)
+dynamodb         = boto3.resource("dynamodb",       region_name=REGION, config=AWS_CONFIG)
 
 CHUNKS_TABLE           = os.environ.get("CHUNKS_TABLE")
 DOCUMENT_STATUS_TABLE  = os.environ.get("DOCUMENT_STATUS_TABLE")
 KNOWLEDGE_VAULT_BUCKET = os.environ.get("KNOWLEDGE_VAULT_BUCKET")
+TEXTRACT_SNS_TOPIC_ARN = os.environ.get("TEXTRACT_SNS_TOPIC_ARN")
+TEXTRACT_SNS_ROLE_ARN  = os.environ.get("TEXTRACT_SNS_ROLE_ARN")
 EMBEDDING_MODEL_ID     = "amazon.titan-embed-text-v2:0"
+EMBEDDING_DIMENSIONS   = 256
+
+# Constant part of every Titan request; only inputText is serialised per call
+_EMBED_BODY_TEMPLATE = (
+    '{"inputText": %s, "dimensions": ' + str(EMBEDDING_DIMENSIONS) + ', "normalize": true}'
+)
+
+# Built once per container and reused by warm invocations.  boto3 resources
+# are not thread-safe: this one is only used from the status worker thread.
+doc_status_table = dynamodb.Table(DOCUMENT_STATUS_TABLE) if DOCUMENT_STATUS_TABLE else None
+
+# Single worker: status writes run in the background but in submission order
+_status_executor = ThreadPoolExecutor(max_workers=1)
+
+# Record worker threads each build their own chunks Table (see
+# _chunks_table); clients, unlike resources, are safe to share
+_thread_state = threading.local()
 
 # Hard guardrails – must stay in sync with lambda_function.py constants
 MAX_FILE_SIZE_MB   = 10
@@ -48,10 +107,37 @@ ALLOWED_EXTENSIONS = {
     "png", "jpg", "jpeg", "tiff",
 }
 
+# Extraction route by extension (Textract supports DOCX natively)
+PLAIN_TEXT_EXTENSIONS = {"txt", "csv", "md"}
+TEXTRACT_EXTENSIONS   = {"pdf", "docx", "png", "jpg", "jpeg", "tiff"}
+
+# Plain-text objects are decoded from S3 in pieces of this size
+S3_READ_CHUNK_BYTES = 64 * 1024
+
 # Chunking parameters
 CHUNK_SIZE    = 500   # target characters per chunk
 CHUNK_OVERLAP = 100   # overlap between consecutive chunks
 
+# Runs of 3+ newlines collapse to a paragraph break before chunking
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+# Sentence / paragraph boundaries preferred as split points.  Zero-width
+# lookahead so overlapping candidates (e.g. ".\n\n") are all reported.
+_BOUNDARY_RE = re.compile(r"(?=\.[ \n]|\n\n)")
+
+# Textract async job polling: exponential back-off bounded by a deadline
+TEXTRACT_POLL_INITIAL_DELAY = 1    # seconds
+TEXTRACT_POLL_MAX_DELAY     = 30   # seconds
+TEXTRACT_MAX_WAIT           = 240  # seconds; stays inside the 300 s Lambda timeout
+
+# Max in-flight Bedrock InvokeModel calls per document (respects Bedrock TPS)
+EMBEDDING_CONCURRENCY = 10
+
+# Max S3 event records processed at once per invocation.  The pool outlives
+# the invocation so each worker's chunks Table is reused while warm.
+RECORD_CONCURRENCY = 4
+_record_executor   = ThreadPoolExecutor(max_workers=RECORD_CONCURRENCY)
+
 # ---------------------------------------------------------------------------
 # Document status helpers
 # ---------------------------------------------------------------------------
@@ -59,122 +145,182 @@ CHUNK_OVERLAP = 100   # overlap between consecutive chunks
 def _update_status(user_id: str, doc_key: str, status: str,
                    chunk_count: int = 0, error: str = ""):
     """
-    Write a processing status record to the document_status DynamoDB table.
+    Queue a processing status record for the document_status DynamoDB table.
     Statuses: 'processing' | 'indexed' | 'error'
     Silently no-ops when DOCUMENT_STATUS_TABLE is not configured.
+
+    The write happens on a single background worker, so it stays off the
+    processing path while updates still land in the order they were made.
+    Call _flush_status_updates before the invocation returns.
     """
-    if not DOCUMENT_STATUS_TABLE:
+    if not doc_status_table:
         return
-    table = dynamodb.Table(DOCUMENT_STATUS_TABLE)
     item = {
         "user_id":      user_id,
         "doc_key":      doc_key,
-        "filename":     doc_key.split("/")[-1],
+        "filename":     doc_key.rsplit("/", 1)[-1],
         "status":       status,
         "chunk_count":  chunk_count,
         "last_updated": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
     }
     if error:
         item["error"] = error
-    table.put_item(Item=item)
+    _status_executor.submit(_put_status, item)
+
+
+def _put_status(item: dict):
+    try:
+        doc_status_table.put_item(Item=item)
+    except Exception as e:
+        print(f"Status update error for {item['doc_key']} (non-fatal): {e}")
+
+
+def _discard_status(user_id: str, doc_key: str):
+    """
+    Queue removal of the status record of a document that was deleted while
+    it was being processed (behind any update already queued for it).
+    """
+    if doc_status_table:
+        _status_executor.submit(_delete_status, user_id, doc_key)
+
+
+def _delete_status(user_id: str, doc_key: str):
+    try:
+        doc_status_table.delete_item(Key={"user_id": user_id, "doc_key": doc_key})
+    except Exception as e:
+        print(f"Status delete error for {doc_key} (non-fatal): {e}")
+
+
+def _flush_status_updates():
+    """Block until every queued status update has been written."""
+    # The executor has one worker, so a no-op completes only after all
+    # previously submitted updates.
+    _status_executor.submit(lambda: None).result()
 
 
 # ---------------------------------------------------------------------------
 # Text extraction helpers
 # ---------------------------------------------------------------------------
 
-def extract_text_from_txt(body_bytes: bytes) -> str:
-    """Decode raw bytes as UTF-8 text (works for .txt and .csv)."""
-    return body_bytes.decode("utf-8", errors="replace")
+def extract_text_from_txt(body) -> str:
+    """
+    Decode an S3 StreamingBody as UTF-8 text (works for .txt and .csv).
+    The body is decoded incrementally in S3_READ_CHUNK_BYTES pieces, so the
+    raw object bytes are never held in memory alongside the decoded text;
+    multi-byte characters split across pieces are reassembled by the
+    incremental decoder.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    parts = [decoder.decode(piece) for piece in body.iter_chunks(S3_READ_CHUNK_BYTES)]
+    parts.append(decoder.decode(b"", final=True))
+    return "".join(parts)
+
 
+def _line_texts(blocks: list) -> list[str]:
+    """Return the text of every LINE block in a Textract response."""
+    return [block["Text"] for block in blocks if block.get("BlockType") == "LINE"]
 
-def extract_text_with_textract_sync(bucket: str, key: str) -> str:
+
+def extract_text_with_textract_sync(bucket: str, key: str, etag: str = "") -> str | None:
     """
     Run Textract DetectDocumentText (synchronous) on a single-page document.
     For multi-page PDFs the async API is more appropriate; this version falls
     back to async automatically when the synchronous call is not available
-    (i.e. for PDFs).
+    (i.e. for PDFs).  Returns None when the async job will report back via
+    SNS.
     """
     try:
         response = textract_client.detect_document_text(
             Document={"S3Object": {"Bucket": bucket, "Name": key}}
         )
-        lines = [
-            block["Text"]
-            for block in response.get("Blocks", [])
-            if block.get("BlockType") == "LINE"
-        ]
-        return "\n".join(lines)
+        return "\n".join(_line_texts(response.get("Blocks", [])))
     except textract_client.exceptions.UnsupportedDocumentException:
         # Multi-page PDF – use async API
-        return extract_text_with_textract_async(bucket, key)
+        return extract_text_with_textract_async(bucket, key, etag)
     except ClientError as e:
         print(f"Textract sync error: {e}")
         raise
 
 
-def extract_text_with_textract_async(bucket: str, key: str) -> str:
+def get_textract_job_text(job_id: str, first_page: dict | None = None) -> str:
     """
-    Start an async Textract job and poll until completion.
-    Suitable for multi-page PDFs.
+    Collect the LINE text of a SUCCEEDED async Textract job.  Result pages
+    are chained through NextToken, which the API only hands out one page at
+    a time, so they are necessarily fetched sequentially.
     """
-    response = textract_client.start_document_text_detection(
-        DocumentLocation={"S3Object": {"Bucket": bucket, "Name": key}}
-    )
+    page = first_page or textract_client.get_document_text_detection(JobId=job_id)
+    lines = _line_texts(page.get("Blocks", []))
+    next_token = page.get("NextToken")
+    while next_token:
+        page = textract_client.get_document_text_detection(
+            JobId=job_id, NextToken=next_token
+        )
+        lines += _line_texts(page.get("Blocks", []))
+        next_token = page.get("NextToken")
+    return "\n".join(lines)
+
+
+def extract_text_with_textract_async(bucket: str, key: str, etag: str = "") -> str | None:
+    """
+    Start an async Textract job.  Suitable for multi-page PDFs.
+
+    When an SNS completion channel is configured the job is left to notify
+    this Lambda (see _process_textract_notification) and None is returned,
+    so no billed time is spent waiting.  The job is tagged with the object's
+    *etag* so a completion for a since-replaced upload can be recognised.
+    Otherwise poll until completion:
+    polling starts after TEXTRACT_POLL_INITIAL_DELAY and backs off
+    exponentially, so short documents are picked up within a second or two.
+    """
+    params = {"DocumentLocation": {"S3Object": {"Bucket": bucket, "Name": key}}}
+    if etag:
+        params["JobTag"] = etag
+    if TEXTRACT_SNS_TOPIC_ARN and TEXTRACT_SNS_ROLE_ARN:
+        params["NotificationChannel"] = {
+            "SNSTopicArn": TEXTRACT_SNS_TOPIC_ARN,
+            "RoleArn":     TEXTRACT_SNS_ROLE_ARN,
+        }
+    response = textract_client.start_document_text_detection(**params)
     job_id = response["JobId"]
 
-    # Poll with exponential back-off (max ~2 minutes total)
-    delay = 5
-    for _ in range(15):
+    if "NotificationChannel" in params:
+        print(f"Started Textract job {job_id} for {key}; awaiting SNS")
+        return None
+
+    deadline = time.monotonic() + TEXTRACT_MAX_WAIT
+    delay = TEXTRACT_POLL_INITIAL_DELAY
+    while time.monotonic() + delay <= deadline:
         time.sleep(delay)
         result = textract_client.get_document_text_detection(JobId=job_id)
         status = result["JobStatus"]
         if status == "SUCCEEDED":
-            lines = [
-                block["Text"]
-                for block in result.get("Blocks", [])
-                if block.get("BlockType") == "LINE"
-            ]
-            # Handle pagination
-            next_token = result.get("NextToken")
-            while next_token:
-                page = textract_client.get_document_text_detection(
-                    JobId=job_id, NextToken=next_token
-                )
-                lines += [
-                    block["Text"]
-                    for block in page.get("Blocks", [])
-                    if block.get("BlockType") == "LINE"
-                ]
-                next_token = page.get("NextToken")
-            return "\n".join(lines)
+            return get_textract_job_text(job_id, first_page=result)
         elif status == "FAILED":
             raise RuntimeError(f"Textract job {job_id} failed")
-        delay = min(delay * 2, 30)
+        delay = min(delay * 2, TEXTRACT_POLL_MAX_DELAY)
 
     raise TimeoutError(f"Textract job {job_id} did not complete in time")
 
 
-def extract_text(bucket: str, key: str) -> str:
-    """Dispatch text extraction based on file extension."""
+def extract_text(bucket: str, key: str, etag: str = "") -> str | None:
+    """
+    Dispatch text extraction based on file extension.
+    Returns None when extraction was handed off to an async Textract job.
+    """
     ext = key.rsplit(".", 1)[-1].lower() if "." in key else ""
 
-    if ext in ("txt", "csv", "md"):
-        obj = s3_client.get_object(Bucket=bucket, Key=key)
-        return extract_text_from_txt(obj["Body"].read())
-
-    if ext in ("pdf", "png", "jpg", "jpeg", "tiff"):
-        return extract_text_with_textract_sync(bucket, key)
-
-    if ext in ("docx",):
-        # Textract supports DOCX natively
-        return extract_text_with_textract_sync(bucket, key)
+    if ext in TEXTRACT_EXTENSIONS:
+        # Textract reads the object from S3 itself; no download needed
+        return extract_text_with_textract_sync(bucket, key, etag)
 
-    # Fallback: try to read as plain text
+    # Plain text (txt / csv / md), and the fallback for anything else:
+    # a single GetObject either way
     try:
         obj = s3_client.get_object(Bucket=bucket, Key=key)
-        return extract_text_from_txt(obj["Body"].read())
+        return extract_text_from_txt(obj["Body"])
     except Exception as e:
+        if ext in PLAIN_TEXT_EXTENSIONS:
+            raise
         raise ValueError(f"Unsupported file type '.{ext}': {e}")
 
 
@@ -189,47 +335,77 @@ def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVE
     Returns a list of (chunk_index, chunk_text) tuples.
     """
     # Normalise whitespace
-    text = re.sub(r"\n{3,}", "\n\n", text.strip())
+    text = _BLANK_LINES_RE.sub("\n\n", text.strip())
 
-    chunks = []
+    # Offsets of every boundary, found in one pass over the document
+    boundaries = [m.start() for m in _BOUNDARY_RE.finditer(text)]
+
+    # Record (start, end) offsets only; substrings are materialised once below
+    spans = []
     start = 0
-    idx = 0
-    while start < len(text):
+    text_len = len(text)
+    while start < text_len:
         end = start + chunk_size
-        if end < len(text):
-            # Try to break at the last sentence boundary before `end`
-            boundary = max(
-                text.rfind(". ", start, end),
-                text.rfind(".\n", start, end),
-                text.rfind("\n\n", start, end),
-            )
-            if boundary != -1 and boundary > start + overlap:
+        if end < text_len:
+            # Last sentence boundary whose two-char marker fits before `end`
+            i = bisect.bisect_right(boundaries, end - 2)
+            boundary = boundaries[i - 1] if i else -1
+            if boundary > start + overlap:
                 end = boundary + 1  # include the period
             else:
-                # Fall back to last space
+                # Fall back to last space, unless it is so early that the
+                # overlap would slide the window backwards
                 space = text.rfind(" ", start, end)
-                if space > start:
+                if space > start + overlap:
                     end = space
 
-        chunk = text[start:end].strip()
-        if chunk:
-            chunks.append((idx, chunk))
-            idx += 1
-        start = end - overlap  # slide window with overlap
+        spans.append((start, end))
+        # Slide window with overlap, but always make forward progress
+        start = max(end - overlap, start + 1)
 
-    return chunks
+    pieces = (text[s:e].strip() for s, e in spans)
+    return list(enumerate(piece for piece in pieces if piece))
+
+
+def chunk_csv(text: str, chunk_size: int = CHUNK_SIZE):
+    """
+    Split CSV *text* into row-aligned chunks of up to *chunk_size*
+    characters.  Rows are newline-separated, so whole rows are packed into
+    each chunk without sentence heuristics or overlap; a single row longer
+    than *chunk_size* is split with chunk_text.
+    Returns a list of (chunk_index, chunk_text) tuples.
+    """
+    pieces  = []
+    current = []
+    current_len = 0
+    for row in text.splitlines(keepends=True):
+        if current and current_len + len(row) > chunk_size:
+            pieces.append("".join(current))
+            current, current_len = [], 0
+        if len(row) > chunk_size:
+            pieces.extend(body for _, body in chunk_text(row, chunk_size))
+            continue
+        current.append(row)
+        current_len += len(row)
+    if current:
+        pieces.append("".join(current))
+
+    stripped = (piece.strip() for piece in pieces)
+    return list(enumerate(piece for piece in stripped if piece))
 
 
 # ---------------------------------------------------------------------------
 # Embedding generation
 # ---------------------------------------------------------------------------
 
-def generate_embedding(text: str) -> list[float]:
+def generate_embedding(text: str) -> array:
     """
-    Call Amazon Titan Text Embeddings v2 and return the embedding vector.
-    The model returns a 1024-dimensional float vector by default.
+    Call Amazon Titan Text Embeddings v2 and return the embedding vector as
+    a unit-length float32 array, ready to be packed for storage.
+    The model returns a 1024-dimensional float vector by default; we request
+    EMBEDDING_DIMENSIONS.
     """
-    body = json.dumps({"inputText": text, "dimensions": 256, "normalize": True})
+    body = _EMBED_BODY_TEMPLATE % json.dumps(text)
     response = bedrock_runtime.invoke_model(
         modelId=EMBEDDING_MODEL_ID,
         body=body,
@@ -237,17 +413,96 @@ def generate_embedding(text: str) -> list[float]:
         accept="application/json",
     )
     result = json.loads(response["body"].read())
-    return result["embedding"]
+    return _normalize(result["embedding"])
+
+
+def _normalize(embedding: list[float]) -> array:
+    """
+    Convert *embedding* to float32 once and rescale it to unit length.
+    Titan already normalises (normalize=true), but re-normalising after the
+    float32 conversion guarantees every stored vector has norm 1, so
+    retrieval can score chunks with a plain dot product.
+    """
+    vec = array("f", embedding)
+    norm = math.sqrt(sum(x * x for x in vec))
+    if norm and abs(norm - 1.0) > 1e-6:
+        vec = array("f", [x / norm for x in vec])
+    return vec
+
+
+def chunk_hash(text: str) -> str:
+    """Content hash identifying chunks whose embedding can be reused."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def generate_embeddings(chunks: list[tuple[int, str]],
+                        known: dict[str, Binary] | None = None
+                        ) -> list[tuple[int, str, str, Binary]]:
+    """
+    Embed every (chunk_index, chunk_text) pair, calling Bedrock once per
+    distinct chunk text that is not already in *known* (a chunk_hash →
+    packed embedding map of previously stored chunks).
+
+    Each InvokeModel call is an I/O-bound HTTPS round-trip, so overlapping
+    up to EMBEDDING_CONCURRENCY of them collapses wall time from the sum of
+    the calls towards the slowest one.  boto3 clients are thread-safe.
+    Returns (chunk_index, chunk_text, chunk_hash, packed_embedding) tuples
+    in input order.
+    """
+    if not chunks:
+        return []
+    embeddings = dict(known or {})
+    hashes = [chunk_hash(body) for _, body in chunks]
+
+    pending = {}
+    for h, (_, body) in zip(hashes, chunks):
+        if h not in embeddings:
+            pending.setdefault(h, body)
+
+    if pending:
+        workers = min(EMBEDDING_CONCURRENCY, len(pending))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            fresh = pool.map(generate_embedding, pending.values())
+            for h, embedding in zip(pending, fresh):
+                embeddings[h] = pack_embedding(embedding)
+    print(f"Embedded {len(pending)} of {len(chunks)} chunks; reused the rest")
+
+    return [
+        (chunk_idx, chunk_body, h, embeddings[h])
+        for (chunk_idx, chunk_body), h in zip(chunks, hashes)
+    ]
 
 
 # ---------------------------------------------------------------------------
 # DynamoDB helpers
 # ---------------------------------------------------------------------------
 
-def store_chunk(table, user_id: str, doc_key: str, chunk_idx: int,
-                chunk_text_val: str, embedding: list[float]):
+def pack_embedding(embedding: array) -> Binary:
     """
-    Write one document chunk to DynamoDB.
+    Quantise *embedding* to int8 and pack it for a Binary attribute: a
+    little-endian float32 scale followed by one signed byte per dimension
+    (value ≈ byte * scale).  Scaling by the largest component keeps the
+    full int8 range in use; the rounding error is far below what ranking
+    against a 0.30 threshold can notice, and a 256-dim vector is 260 bytes.
+    """
+    peak = max(map(abs, embedding)) or 1.0
+    scale = peak / 127
+    return Binary(struct.pack(
+        f"<f{len(embedding)}b", scale, *[round(x / scale) for x in embedding]
+    ))
+
+
+def chunk_id_for(doc_key: str, chunk_idx: int) -> str:
+    """Sort key of chunk *chunk_idx* of *doc_key*."""
+    return f"{doc_key}#{chunk_idx:05d}"
+
+
+def store_chunks(table, user_id: str, doc_key: str,
+                 embedded_chunks: list[tuple[int, str, str, Binary]]):
+    """
+    Write chunks of one document to DynamoDB through a single
+    batch_writer, which flushes BatchWriteItem requests of up to 25 items
+    (and retries unprocessed items) instead of one PutItem per chunk.
 
     Schema:
       PK  user_id     (S)
@@ -256,130 +511,283 @@ def store_chunk(table, user_id: str, doc_key: str, chunk_idx: int,
       filename        (S)  – basename only
       chunk_index     (N)
       chunk_text      (S)
-      embedding       (S)  – JSON-encoded list[float]  (stored as string to
-                             avoid DynamoDB Number precision limits)
-    """
-    chunk_id = f"{doc_key}#{chunk_idx:05d}"
-    filename = doc_key.split("/")[-1]
-
-    # Convert floats to Decimal for DynamoDB (only needed for Number types;
-    # we store the embedding as a JSON string to avoid conversion overhead)
-    table.put_item(
-        Item={
-            "user_id":     user_id,
-            "chunk_id":    chunk_id,
-            "doc_key":     doc_key,
-            "filename":    filename,
-            "chunk_index": chunk_idx,
-            "chunk_text":  chunk_text_val,
-            "embedding":   json.dumps(embedding),  # serialised as string
-        }
-    )
+      chunk_hash      (S)  – content hash, lets re-uploads reuse embeddings
+      embedding       (B)  – float32 scale + int8 components (260 B for
+                             256 dims vs ~5 KB as JSON text)
+    """
+    filename = doc_key.rsplit("/", 1)[-1]
+
+    with table.batch_writer(overwrite_by_pkeys=["user_id", "chunk_id"]) as batch:
+        for chunk_idx, chunk_text_val, content_hash, embedding in embedded_chunks:
+            batch.put_item(
+                Item={
+                    "user_id":     user_id,
+                    "chunk_id":    chunk_id_for(doc_key, chunk_idx),
+                    "doc_key":     doc_key,
+                    "filename":    filename,
+                    "chunk_index": chunk_idx,
+                    "chunk_text":  chunk_text_val,
+                    "chunk_hash":  content_hash,
+                    "embedding":   embedding,
+                }
+            )
 
 
-def delete_existing_chunks(table, user_id: str, doc_key: str):
+def load_existing_chunks(table, user_id: str, doc_key: str) -> dict[str, dict]:
     """
-    Remove all previously stored chunks for a given document so that
-    re-uploaded files don't accumulate stale data.
+    Return {chunk_id: item} for every chunk already stored for *doc_key*,
+    projecting only the key, content hash and embedding.
+
+    Pages through every Query result (a large document's chunks exceed the
+    1 MB page limit).  The "#" suffix keeps "a.txt" from matching the
+    chunks of "a.txt.bak".
     """
-    # Query all chunks for this (user_id, doc_key) prefix
-    response = table.query(
-        KeyConditionExpression=(
-            boto3.dynamodb.conditions.Key("user_id").eq(user_id)
-            & boto3.dynamodb.conditions.Key("chunk_id").begins_with(doc_key)
-        )
+    key_condition = (
+        Key("user_id").eq(user_id)
+        & Key("chunk_id").begins_with(f"{doc_key}#")
     )
-    items = response.get("Items", [])
+    existing = {}
+    last_key = None
+    while True:
+        kwargs = {
+            "KeyConditionExpression": key_condition,
+            "ProjectionExpression":   "chunk_id, chunk_hash, embedding",
+        }
+        if last_key:
+            kwargs["ExclusiveStartKey"] = last_key
+        response = table.query(**kwargs)
+        for item in response.get("Items", []):
+            existing[item["chunk_id"]] = item
+        last_key = response.get("LastEvaluatedKey")
+        if not last_key:
+            return existing
+
+
+def delete_chunks(table, user_id: str, chunk_ids):
+    """Batch-delete the given chunk ids of *user_id*."""
     with table.batch_writer() as batch:
-        for item in items:
-            batch.delete_item(
-                Key={"user_id": item["user_id"], "chunk_id": item["chunk_id"]}
-            )
+        for chunk_id in chunk_ids:
+            batch.delete_item(Key={"user_id": user_id, "chunk_id": chunk_id})
 
 
 # ---------------------------------------------------------------------------
 # Lambda entry point
 # ---------------------------------------------------------------------------
 
+def _current_etag(bucket: str, key: str) -> str | None:
+    """
+    ETag (without quotes) of the object now stored at *key*, or None when
+    it has been deleted.
+    """
+    try:
+        head = s3_client.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+    return head["ETag"].strip('"')
+
+
+def _chunks_table():
+    """
+    The calling thread's chunks Table, built from its own boto3 session on
+    first use (resources must not be shared between the record workers).
+    """
+    table = getattr(_thread_state, "chunks_table", None)
+    if table is None:
+        resource = boto3.session.Session().resource(
+            "dynamodb", region_name=REGION, config=AWS_CONFIG
+        )
+        table = _thread_state.chunks_table = resource.Table(CHUNKS_TABLE)
+    return table
+
+
+def _split_key(key: str) -> tuple[str, str] | None:
+    """Split a vault key of the form <user_id>/<filename>, or return None."""
+    parts = key.split("/", 1)
+    if len(parts) != 2 or not parts[1]:
+        print(f"Skipping unexpected key format: {key}")
+        return None
+    return parts[0], parts[1]
+
+
+def _index_text(user_id: str, key: str, filename: str, raw_text: str) -> dict:
+    """Chunk, embed and store extracted text; record the final status."""
+    print(f"Extracted {len(raw_text)} characters from {filename}")
+
+    if not raw_text.strip():
+        msg = f"No extractable text found in '{filename}'."
+        print(msg)
+        _update_status(user_id, key, "error", error=msg)
+        return {"key": key, "status": "error", "error": msg}
+
+    # 2. Look up chunks from a previous upload of the same file
+    chunks_table = _chunks_table()
+    existing = load_existing_chunks(chunks_table, user_id, key)
+    known = {
+        item["chunk_hash"]: item["embedding"]
+        for item in existing.values()
+        if item.get("chunk_hash") and isinstance(item.get("embedding"), Binary)
+    }
+
+    # 3. Chunk the text (CSV rows are kept whole)
+    is_csv = filename.rsplit(".", 1)[-1].lower() == "csv"
+    chunks = chunk_csv(raw_text) if is_csv else chunk_text(raw_text)
+    print(f"Split into {len(chunks)} chunks")
+
+    # 4. Embed chunks not seen before, then write only what changed and
+    #    delete chunks past the end of the new version
+    embedded = generate_embeddings(chunks, known)
+    changed = [
+        c for c in embedded
+        if existing.get(chunk_id_for(key, c[0]), {}).get("chunk_hash") != c[2]
+    ]
+    current = {chunk_id_for(key, idx) for idx, _ in chunks}
+    delete_chunks(chunks_table, user_id, [cid for cid in existing if cid not in current])
+    store_chunks(chunks_table, user_id, key, changed)
+
+    print(f"Stored {len(changed)} new or changed chunks for {key}")
+    _update_status(user_id, key, "indexed", chunk_count=len(chunks))
+    return {"key": key, "status": "ok", "chunks": len(chunks)}
+
+
+def _process_record(record: dict) -> dict | None:
+    """
+    Extract, chunk, embed and store the object referenced by one S3 event
+    record.  Returns a result dict, or None when the key is skipped.
+    """
+    bucket = record["s3"]["bucket"]["name"]
+    # S3 URL-encodes the key (spaces → +, other chars → %XX)
+    key = urllib.parse.unquote_plus(record["s3"]["object"]["key"])
+
+    print(f"Processing s3://{bucket}/{key}")
+
+    # Derive user_id from the S3 key prefix (format: <user_id>/<filename>)
+    parts = _split_key(key)
+    if not parts:
+        return None
+
+    user_id, filename = parts
+
+    try:
+        # 0. Mark document as processing
+        _update_status(user_id, key, "processing")
+
+        # Guard: check file extension
+        ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+        if ext not in ALLOWED_EXTENSIONS:
+            msg = f"Unsupported file type '.{ext}'. Skipping."
+            print(msg)
+            _update_status(user_id, key, "error", error=msg)
+            return {"key": key, "status": "error", "error": msg}
+
+        # Guard: check file size before downloading
+        head = s3_client.head_object(Bucket=bucket, Key=key)
+        size_bytes = head.get("ContentLength", 0)
+        if size_bytes > MAX_FILE_SIZE_MB * 1024 * 1024:
+            msg = f"File exceeds {MAX_FILE_SIZE_MB} MB limit ({size_bytes / 1024 / 1024:.1f} MB). Skipping."
+            print(msg)
+            _update_status(user_id, key, "error", error=msg)
+            return {"key": key, "status": "error", "error": msg}
+
+        # 1. Extract text (None: an async Textract job will notify via SNS)
+        etag = head.get("ETag", "").strip('"')
+        raw_text = extract_text(bucket, key, etag)
+        if raw_text is None:
+            return {"key": key, "status": "pending"}
+
+        # Textract polling can take minutes; do not index a file that was
+        # deleted or replaced meanwhile (a replacement has its own event)
+        current = _current_etag(bucket, key)
+        if current != etag:
+            return _skip_superseded(user_id, key, current)
+
+        return _index_text(user_id, key, filename, raw_text)
+
+    except Exception as e:
+        print(f"Error processing {key}: {e}")
+        _update_status(user_id, key, "error", error=str(e))
+        return {"key": key, "status": "error", "error": str(e)}
+
+
+def _process_textract_notification(record: dict) -> dict | None:
+    """
+    Finish indexing a document whose async Textract job has completed.
+    The SNS message carries the job id, its status and the S3 location the
+    job was started on, which identifies the user and document.
+    """
+    message = json.loads(record["Sns"]["Message"])
+    job_id  = message["JobId"]
+    bucket  = message["DocumentLocation"]["S3Bucket"]
+    key     = message["DocumentLocation"]["S3ObjectName"]
+
+    print(f"Textract job {job_id} for {key} finished: {message['Status']}")
+
+    parts = _split_key(key)
+    if not parts:
+        return None
+
+    user_id, filename = parts
+
+    try:
+        # The job ran on the version of the object tagged at start; skip it
+        # if the file has since been deleted or re-uploaded (jobs started
+        # without a tag only need the object to still exist)
+        current = _current_etag(bucket, key)
+        job_tag = message.get("JobTag")
+        if current is None or (job_tag and job_tag != current):
+            return _skip_superseded(user_id, key, current)
+
+        if message["Status"] != "SUCCEEDED":
+            raise RuntimeError(f"Textract job {job_id} failed")
+        return _index_text(user_id, key, filename, get_textract_job_text(job_id))
+
+    except Exception as e:
+        print(f"Error processing {key}: {e}")
+        _update_status(user_id, key, "error", error=str(e))
+        return {"key": key, "status": "error", "error": str(e)}
+
+
+def _skip_superseded(user_id: str, key: str, current_etag: str | None) -> dict:
+    """
+    Drop extracted text for an object that was deleted (current_etag None)
+    or replaced while it was processed.  A deleted document's status record
+    is removed so it cannot outlive the file; a replaced one is left to the
+    processing run of the newer upload.
+    """
+    if current_etag is None:
+        print(f"{key} was deleted during processing; skipping")
+        _discard_status(user_id, key)
+    else:
+        print(f"{key} was replaced during processing; skipping stale version")
+    return {"key": key, "status": "skipped"}
+
+
+def _dispatch_record(record: dict) -> dict | None:
+    """Route a record to the S3-upload or Textract-completion path."""
+    if record.get("EventSource") == "aws:sns":
+        return _process_textract_notification(record)
+    return _process_record(record)
+
+
 def lambda_handler(event, context):
     """
-    Invoked by S3 ObjectCreated notifications.  Each record in *event*
-    represents one uploaded file.
+    Invoked by S3 ObjectCreated notifications and by SNS Textract completion
+    notifications.  Each S3 record in *event* represents one uploaded file.
+    Records are processed concurrently so a slow document does not hold up
+    the others.
     """
     if not CHUNKS_TABLE:
         raise EnvironmentError("CHUNKS_TABLE environment variable is not set")
 
-    table = dynamodb.Table(CHUNKS_TABLE)
-    results = []
-
-    for record in event.get("Records", []):
-        bucket = record["s3"]["bucket"]["name"]
-        # S3 URL-encodes the key (spaces → +, other chars → %XX)
-        key = urllib.parse.unquote_plus(record["s3"]["object"]["key"])
+    records = event.get("Records", [])
+    if not records:
+        return {"processed": []}
 
-        print(f"Processing s3://{bucket}/{key}")
-
-        # Derive user_id from the S3 key prefix (format: <user_id>/<filename>)
-        parts = key.split("/", 1)
-        if len(parts) != 2 or not parts[1]:
-            print(f"Skipping unexpected key format: {key}")
-            continue
+    try:
+        outcomes = list(_record_executor.map(_dispatch_record, records))
+    finally:
+        # Lambda may freeze the container once we return
+        _flush_status_updates()
 
-        user_id, filename = parts
-
-        try:
-            # 0. Mark document as processing
-            _update_status(user_id, key, "processing")
-
-            # Guard: check file extension
-            ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
-            if ext not in ALLOWED_EXTENSIONS:
-                msg = f"Unsupported file type '.{ext}'. Skipping."
-                print(msg)
-                _update_status(user_id, key, "error", error=msg)
-                results.append({"key": key, "status": "error", "error": msg})
-                continue
-
-            # Guard: check file size before downloading
-            head = s3_client.head_object(Bucket=bucket, Key=key)
-            size_bytes = head.get("ContentLength", 0)
-            if size_bytes > MAX_FILE_SIZE_MB * 1024 * 1024:
-                msg = f"File exceeds {MAX_FILE_SIZE_MB} MB limit ({size_bytes / 1024 / 1024:.1f} MB). Skipping."
-                print(msg)
-                _update_status(user_id, key, "error", error=msg)
-                results.append({"key": key, "status": "error", "error": msg})
-                continue
-
-            # 1. Extract text
-            raw_text = extract_text(bucket, key)
-            print(f"Extracted {len(raw_text)} characters from {filename}")
-
-            if not raw_text.strip():
-                msg = f"No extractable text found in '{filename}'."
-                print(msg)
-                _update_status(user_id, key, "error", error=msg)
-                results.append({"key": key, "status": "error", "error": msg})
-                continue
-
-            # 2. Delete stale chunks from a previous upload of the same file
-            delete_existing_chunks(table, user_id, key)
-
-            # 3. Chunk the text
-            chunks = chunk_text(raw_text)
-            print(f"Split into {len(chunks)} chunks")
-
-            # 4. Generate embeddings and store each chunk
-            for chunk_idx, chunk_body in chunks:
-                embedding = generate_embedding(chunk_body)
-                store_chunk(table, user_id, key, chunk_idx, chunk_body, embedding)
-
-            print(f"Stored {len(chunks)} chunks for {key}")
-            _update_status(user_id, key, "indexed", chunk_count=len(chunks))
-            results.append({"key": key, "status": "ok", "chunks": len(chunks)})
-
-        except Exception as e:
-            print(f"Error processing {key}: {e}")
-            _update_status(user_id, key, "error", error=str(e))
-            results.append({"key": key, "status": "error", "error": str(e)})
-
-    return {"processed": results}
+    return {"processed": [r for r in outcomes if r is not None]}
@@ -3,7 +3,7 @@ Document management handler (upload, list, delete).
 Handles the /documents route for the Lambda function.
 """
 import json
-import boto3.dynamodb.conditions
+from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
 
 from config import s3_client, vault_bucket, chunks_table, doc_status_table
@@ -42,37 +42,55 @@ def _list_documents(user_id, headers):
     prefix = f"{user_id}/"
     try:
         response = s3_client.list_objects_v2(Bucket=vault_bucket, Prefix=prefix)
+        contents = response.get('Contents', [])
+        statuses = _load_statuses(user_id) if contents else {}
         files = []
-        if 'Contents' in response:
-            for obj in response['Contents']:
-                filename   = obj['Key'].split('/')[-1]
-                file_entry = {
-                    'name':        filename,
-                    'size':        obj['Size'],
-                    'lastModified': str(obj['LastModified']),
-                    'indexStatus': 'unknown',
-                }
-                if doc_status_table:
-                    try:
-                        status_resp = doc_status_table.get_item(
-                            Key={'user_id': user_id, 'doc_key': obj['Key']}
-                        )
-                        status_item = status_resp.get('Item')
-                        if status_item:
-                            file_entry['indexStatus'] = status_item.get('status', 'unknown')
-                            file_entry['chunkCount']  = int(status_item.get('chunk_count', 0))
-                            file_entry['lastIndexed'] = status_item.get('last_updated', '')
-                            if status_item.get('error'):
-                                file_entry['indexError'] = status_item['error']
-                    except Exception as status_err:
-                        print(f"Status lookup error for {obj['Key']}: {status_err}")
-                files.append(file_entry)
+        for obj in contents:
+            filename   = obj['Key'].split('/')[-1]
+            file_entry = {
+                'name':        filename,
+                'size':        obj['Size'],
+                'lastModified': str(obj['LastModified']),
+                'indexStatus': 'unknown',
+            }
+            status_item = statuses.get(obj['Key'])
+            if status_item:
+                file_entry['indexStatus'] = status_item.get('status', 'unknown')
+                file_entry['chunkCount']  = int(status_item.get('chunk_count', 0))
+                file_entry['lastIndexed'] = status_item.get('last_updated', '')
+                if status_item.get('error'):
+                    file_entry['indexError'] = status_item['error']
+            files.append(file_entry)
         return {'statusCode': 200, 'headers': headers, 'body': json.dumps({'files': files})}
     except ClientError as e:
         print(f"Error listing files: {e}")
         return {'statusCode': 500, 'headers': headers, 'body': json.dumps({'error': 'Failed to list files'})}
 
 
+def _load_statuses(user_id):
+    """
+    Fetch every status record of *user_id* in one Query (the user's records
+    share a partition) instead of one GetItem per file.
+    Returns {doc_key: item}; empty when the status table is unavailable.
+    """
+    if not doc_status_table:
+        return {}
+    statuses = {}
+    kwargs   = {'KeyConditionExpression': Key('user_id').eq(user_id)}
+    try:
+        while True:
+            resp = doc_status_table.query(**kwargs)
+            for item in resp.get('Items', []):
+                statuses[item['doc_key']] = item
+            last_key = resp.get('LastEvaluatedKey')
+            if not last_key:
+                break
+            kwargs['ExclusiveStartKey'] = last_key
+    except Exception as status_err:
+        print(f"Status lookup error for {user_id}: {status_err}")
+    return statuses
+
+
 def _request_upload(event, user_id, headers):
     """Generate a presigned S3 URL for direct client upload."""
     body      = json.loads(event.get('body', '{}'))
@@ -134,20 +152,9 @@ def _delete_document(event, user_id, headers):
 
         if chunks_table:
             try:
-                resp       = chunks_table.query(
-                    KeyConditionExpression=(
-                        boto3.dynamodb.conditions.Key('user_id').eq(user_id)
-                        & boto3.dynamodb.conditions.Key('chunk_id').begins_with(key)
-                    )
-                )
-                chunk_items = resp.get('Items', [])
-                if chunk_items:
-                    with chunks_table.batch_writer() as batch:
-                        for item in chunk_items:
-                            batch.delete_item(
-                                Key={'user_id': item['user_id'], 'chunk_id': item['chunk_id']}
-                            )
-                    print(f"Purged {len(chunk_items)} chunks for {key}")
+                purged = _purge_chunks(user_id, key)
+                if purged:
+                    print(f"Purged {purged} chunks for {key}")
             except Exception as chunk_err:
                 print(f"Chunk purge error (non-fatal): {chunk_err}")
 
@@ -161,3 +168,32 @@ def _delete_document(event, user_id, headers):
 
     except ClientError as e:
         return {'statusCode': 500, 'headers': headers, 'body': json.dumps({'error': str(e)})}
+
+
+def _purge_chunks(user_id, key):
+    """
+    Delete every chunk of document *key*; returns how many were removed.
+
+    Only the sort key is projected, so the Query reads a few bytes per chunk
+    instead of its text and embedding, and every page is followed (a large
+    document's chunks exceed one page). The "#" suffix keeps "a.txt" from
+    matching the chunks of "a.txt.bak".
+    """
+    kwargs = {
+        'KeyConditionExpression': (
+            Key('user_id').eq(user_id)
+            & Key('chunk_id').begins_with(f"{key}#")
+        ),
+        'ProjectionExpression': 'chunk_id',
+    }
+    purged = 0
+    with chunks_table.batch_writer(overwrite_by_pkeys=['user_id', 'chunk_id']) as batch:
+        while True:
+            resp = chunks_table.query(**kwargs)
+            for item in resp.get('Items', []):
+                batch.delete_item(Key={'user_id': user_id, 'chunk_id': item['chunk_id']})
+                purged += 1
+            last_key = resp.get('LastEvaluatedKey')
+            if not last_key:
+                return purged
+            kwargs['ExclusiveStartKey'] = last_key
@@ -1,6 +1,7 @@
+import functools
 import json
 import os
-import datetime
+import time
 from botocore.exceptions import ClientError
 
 from config import bedrock_runtime, usage_table
@@ -9,25 +10,89 @@ from documents import handle_documents
 
 DAILY_MSG_LIMIT  = 20
 MAX_QUERY_LENGTH = 2000   # chars; hard cap on user message
+ADMIN_GROUP      = 'Admins'   # Cognito group exempt from the daily quota
+
+# Full request events are only serialised to the logs when debugging
+LOG_DEBUG = os.environ.get('LOG_LEVEL', 'INFO').upper() == 'DEBUG'
+
+# Same on every response; built once and never mutated
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin':  '*',
+    'Access-Control-Allow-Headers': 'Content-Type,Authorization',
+    'Access-Control-Allow-Methods': 'GET,POST,PUT,DELETE,OPTIONS',
+}
+
+SECONDS_PER_DAY = 86400
+_day_key_cache  = [-1, '']   # [epoch day, 'YYYY-MM-DD'] of the last quota check
+
+
+def _utc_day_key():
+    """
+    Today's UTC date as 'YYYY-MM-DD' (the quota resets at midnight UTC).
+    The string is only reformatted when the epoch day rolls over.
+    """
+    day = int(time.time()) // SECONDS_PER_DAY
+    if day != _day_key_cache[0]:
+        _day_key_cache[:] = [day, time.strftime('%Y-%m-%d', time.gmtime(day * SECONDS_PER_DAY))]
+    return _day_key_cache[1]
+
+
+BEDROCK_MODEL_ID = os.environ.get('BEDROCK_MODEL_ID', 'amazon.nova-lite-v1:0')
+SYSTEM_PROMPT = (
+    "You are a helpful AI assistant. "
+    "Always respond using Markdown formatting. "
+    "Use headers, bullet points, bold/italic text, code blocks, "
+    "and tables where appropriate to make your responses clear and well-structured."
+)
+
+# The chat request body is fixed apart from the user turn, so everything
+# around it is serialised once and the message is spliced in per call
+_CHAT_BODY_PREFIX, _CHAT_BODY_SUFFIX = json.dumps({
+    "system": [{"text": SYSTEM_PROMPT}],
+    "messages": [{"role": "user", "content": [{"text": "\0"}]}],
+    "inferenceConfig": {"maxTokens": 512, "temperature": 0.5, "topP": 0.9},
+}).split('"\\u0000"')
+
+# Latency-optimized inference is only offered for some models (and fails
+# validation for the rest), so it is requested only when the configured
+# model, or a cross-region profile of it, is on this list
+LATENCY_OPTIMIZED_MODELS = (
+    'amazon.nova-pro',
+    'anthropic.claude-3-5-haiku',
+    'meta.llama3-1-70b',
+    'meta.llama3-1-405b',
+)
+BEDROCK_LATENCY = os.environ.get('BEDROCK_LATENCY', 'optimized').lower()
+
+_INVOKE_OPTIONS = {'modelId': BEDROCK_MODEL_ID}
+if BEDROCK_LATENCY == 'optimized' and any(m in BEDROCK_MODEL_ID for m in LATENCY_OPTIMIZED_MODELS):
+    _INVOKE_OPTIONS['performanceConfigLatency'] = 'optimized'
+
+
+# Quota update values never change, so they are serialised once
+_QUOTA_VALUES = {
+    ':start': {'N': '0'},
+    ':inc':   {'N': '1'},
+    ':limit': {'N': str(DAILY_MSG_LIMIT)},
+}
 
 
 def check_and_update_quota(user_id):
     if not usage_table:
         return True  # quota skipped in local dev without DDB
 
-    today = datetime.datetime.now().strftime('%Y-%m-%d')
+    today = _utc_day_key()
 
     try:
-        usage_table.update_item(
-            Key={'user_id': user_id, 'date': today},
+        # Low-level call with pre-serialised values: skips the resource
+        # layer's per-call type serialisation on every chat turn
+        usage_table.meta.client.update_item(
+            TableName=usage_table.name,
+            Key={'user_id': {'S': user_id}, 'date': {'S': today}},
             UpdateExpression="SET request_count = if_not_exists(request_count, :start) + :inc",
-            ExpressionAttributeValues={
-                ':start': 0,
-                ':inc':   1,
-                ':limit': DAILY_MSG_LIMIT,
-            },
+            ExpressionAttributeValues=_QUOTA_VALUES,
             ConditionExpression="request_count < :limit OR attribute_not_exists(request_count)",
-            ReturnValues="UPDATED_NEW",
+            ReturnValues="NONE",
         )
         return True
     except ClientError as e:
@@ -37,38 +102,47 @@ def check_and_update_quota(user_id):
         raise
 
 
+def _parse_claims(event):
+    """Return the JWT claims the API Gateway authorizer attached, or {}."""
+    auth_context = event.get('requestContext', {}).get('authorizer')
+    if not auth_context:
+        return {}
+    jwt = auth_context.get('jwt')
+    if jwt and 'claims' in jwt:
+        return jwt.get('claims') or {}
+    return auth_context.get('claims') or {}
+
+
+@functools.lru_cache(maxsize=64)
+def _groups_from_string(groups_claim):
+    """
+    Parse a string cognito:groups claim. HTTP API JWT authorizers flatten
+    list claims to strings such as '[Admins Editors]'; a single group may
+    also arrive bare. Cached because the same few values repeat.
+    """
+    return frozenset(g.strip(',') for g in groups_claim.strip('[]').split())
+
+
+def _is_admin(claims):
+    """Whether the caller belongs to the Cognito 'Admins' group."""
+    groups_claim = claims.get('cognito:groups')
+    if not groups_claim:
+        return False
+    if isinstance(groups_claim, str):
+        return ADMIN_GROUP in _groups_from_string(groups_claim)
+    return ADMIN_GROUP in groups_claim
+
+
 def lambda_handler(event, context):
-    print("Event:", json.dumps(event))
+    if LOG_DEBUG:
+        print("Event:", json.dumps(event, default=str))   # local server bodies are bytes
 
-    headers = {
-        'Access-Control-Allow-Origin':  '*',
-        'Access-Control-Allow-Headers': 'Content-Type,Authorization',
-        'Access-Control-Allow-Methods': 'GET,POST,PUT,DELETE,OPTIONS',
-    }
+    headers = CORS_HEADERS
 
     try:
         # --- Auth ---
-        user_id     = "anonymous"
-        user_groups = []
-        claims      = {}
-
-        if 'requestContext' in event and 'authorizer' in event['requestContext']:
-            auth_context = event['requestContext']['authorizer']
-            jwt = auth_context.get('jwt')
-            if jwt and 'claims' in jwt:
-                claims = jwt.get('claims') or {}
-            elif 'claims' in auth_context:
-                claims = auth_context.get('claims') or {}
-
-            if claims:
-                user_id = claims.get('sub')
-                groups_claim = claims.get('cognito:groups', [])
-                if isinstance(groups_claim, list):
-                    user_groups = groups_claim
-                elif isinstance(groups_claim, str):
-                    user_groups = [groups_claim]
-
-        is_admin = 'Admins' in user_groups
+        claims  = _parse_claims(event)
+        user_id = claims.get('sub') if claims else "anonymous"
 
         # --- Route: /documents ---
         path     = event.get('requestContext', {}).get('http', {}).get('path', '')
@@ -87,7 +161,7 @@ def lambda_handler(event, context):
                 'body': json.dumps({'error': 'Authentication required'}),
             }
 
-        if not is_admin:
+        if not _is_admin(claims):
             if not check_and_update_quota(user_id):
                 return {
                     'statusCode': 429,
@@ -130,21 +204,9 @@ def lambda_handler(event, context):
         augmented_message = build_rag_prompt(user_message, context_chunks)
 
         # --- Bedrock invocation ---
-        model_id = os.environ.get('BEDROCK_MODEL_ID', 'amazon.nova-lite-v1:0')
-        request_body = json.dumps({
-            "system": [{
-                "text": (
-                    "You are a helpful AI assistant. "
-                    "Always respond using Markdown formatting. "
-                    "Use headers, bullet points, bold/italic text, code blocks, "
-                    "and tables where appropriate to make your responses clear and well-structured."
-                )
-            }],
-            "messages": [{"role": "user", "content": [{"text": augmented_message}]}],
-            "inferenceConfig": {"maxTokens": 512, "temperature": 0.5, "topP": 0.9},
-        })
-
-        response      = bedrock_runtime.invoke_model(modelId=model_id, body=request_body)
+        request_body = _CHAT_BODY_PREFIX + json.dumps(augmented_message) + _CHAT_BODY_SUFFIX
+
+        response      = bedrock_runtime.invoke_model(body=request_body, **_INVOKE_OPTIONS)
         response_body = json.loads(response['body'].read())
         completion    = response_body['output']['message']['content'][0]['text']
 
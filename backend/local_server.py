@@ -1,4 +1,5 @@
 from flask import Flask, request, make_response
+import functools
 import json
 import os
 import sys
@@ -30,8 +31,18 @@ from lambda_function import lambda_handler
 
 app = Flask(__name__)
 
+# CORS headers added to every local response (fix for local dev)
+CORS_HEADERS = (
+    ("Access-Control-Allow-Origin", "*"),
+    ("Access-Control-Allow-Methods", "GET, POST, PUT, DELETE, OPTIONS"),
+    ("Access-Control-Allow-Headers", "Content-Type, Authorization"),
+)
 
-# Helper to decode JWT payload without verification (for local simulation only)
+
+# Helper to decode JWT payload without verification (for local simulation only).
+# The frontend sends the same token on every request until it refreshes, so
+# decoded payloads are cached by token string.
+@functools.lru_cache(maxsize=64)
 def decode_jwt_payload(token):
     try:
         # JWT is header.payload.signature
@@ -52,9 +63,7 @@ def decode_jwt_payload(token):
 def proxy(text):
     if request.method == 'OPTIONS':
         response = make_response()
-        response.headers.add("Access-Control-Allow-Origin", "*")
-        response.headers.add("Access-Control-Allow-Headers", "Content-Type,Authorization")
-        response.headers.add("Access-Control-Allow-Methods", "GET,POST,PUT,DELETE,OPTIONS")
+        response.headers.update(CORS_HEADERS)
         return response
 
     # Mock API Gateway event structure (HTTP API payload 2.0 ish)
@@ -70,7 +79,10 @@ def proxy(text):
             'authorizer': {'jwt': {'claims': {}}}
         },
         'queryStringParameters': request.args.to_dict(),
-        'body': request.data.decode('utf-8') if request.data else '{}'
+        # Raw bytes: json.loads in the handlers accepts them directly, so
+        # the body is not decoded and re-validated here first
+        'body': request.get_data() or b'{}',
+        'isBase64Encoded': False,
     }
     
     # Extract Authorization header
@@ -95,18 +107,16 @@ def proxy(text):
     # Create Flask response
     resp = make_response(response_body, status_code)
     
-    # Forward headers returned by Lambda
-    for key, value in headers.items():
-        resp.headers[key] = value
-
-    # Ensure CORS headers are present on all responses (fix for local dev)
-    resp.headers["Access-Control-Allow-Origin"] = "*"
-    resp.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
-    resp.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization"
+    # Forward headers returned by Lambda, then ensure CORS headers are
+    # present on all responses
+    resp.headers.update(headers)
+    resp.headers.update(CORS_HEADERS)
         
     return resp
 
 if __name__ == '__main__':
     print("Starting local backend server...")
     print("Ensure you have AWS credentials configured (e.g. via 'aws configure' or env vars)")
-    app.run(port=8000, debug=True)
+    # One thread per request, so a chat turn blocked on Bedrock does not
+    # hold up document listing or a second chat
+    app.run(port=8000, debug=True, threaded=True)
@@ -1,19 +1,77 @@
 """
 RAG (Retrieval-Augmented Generation) helpers.
-Handles embedding generation, cosine similarity, and context retrieval.
+Handles embedding generation, similarity scoring, and context retrieval.
 """
+import hashlib
+import heapq
 import json
 import math
-import boto3.dynamodb.conditions
+import operator
+import random
+import struct
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-from config import bedrock_runtime, chunks_table
+from config import bedrock_runtime, dynamodb, chunks_table, chunks_table_name, doc_status_table
 
 # ── Constants ──────────────────────────────────────────────────────────────────
 EMBEDDING_MODEL_ID  = 'amazon.titan-embed-text-v2:0'
+EMBEDDING_DIMENSIONS = 256
 RAG_TOP_K           = 5      # chunks injected into the prompt
 RAG_MAX_CHARS       = 4000   # safety cap on total context characters
 RAG_SCORE_THRESHOLD = 0.30   # ignore chunks below this cosine similarity
 
+# Fixed parts of the augmented prompt
+RAG_PREAMBLE = (
+    "Use the following excerpts from the user's documents to help answer "
+    "their question. If the excerpts are not relevant, answer from your "
+    "general knowledge instead.\n\n"
+    "CONTEXT:\n"
+)
+RAG_CONTEXT_SEPARATOR = '\n\n---\n\n'
+
+# Titan request body; only the JSON-encoded input text varies per call
+_EMBED_BODY_TEMPLATE = (
+    '{"inputText": %s, "dimensions": ' + str(EMBEDDING_DIMENSIONS) + ', "normalize": true}'
+)
+
+# Attributes read for every chunk when ranking (chunk_text is left out)
+RANKING_PROJECTION = 'chunk_id, filename, chunk_index, embedding'
+
+# BatchGetItem retries of unprocessed keys: exponential back-off with full
+# jitter, bounded so throttling cannot eat the 30 s chat Lambda timeout
+FETCH_MAX_ATTEMPTS = 4
+FETCH_BACKOFF_BASE = 0.05   # seconds
+FETCH_BACKOFF_MAX  = 1.0    # seconds
+
+# Recent query embeddings (LRU with expiry) so repeated questions, UI
+# retries and follow-ups skip the Titan round-trip
+QUERY_CACHE_SIZE = 256
+QUERY_CACHE_TTL  = 3600   # seconds
+_query_cache: OrderedDict[bytes, tuple[float, list]] = OrderedDict()
+
+# Decoded ranking data per user, reused by warm invocations while the
+# user's document status records (the version token) are unchanged, and
+# for at most USER_CACHE_TTL: status writes are best-effort, so the token
+# alone could leave a container ranking deleted chunks indefinitely.
+# Bounded by users and by total cached chunks: at roughly 0.5 KB per chunk
+# the chunk cap keeps the cache under ~8 MB of the 128 MB chat Lambda.
+USER_CACHE_SIZE       = 32
+USER_CACHE_MAX_CHUNKS = 15000
+USER_CACHE_TTL        = 300   # seconds
+_user_chunks: OrderedDict[str, tuple] = OrderedDict()   # user_id -> (version, loaded_at, vectors, scales, items)
+_user_chunks_total = 0   # chunks held across all entries of _user_chunks
+
+# Guards the two LRUs above: the query cache is filled from executor
+# threads, and the threaded local server can serve chat turns concurrently
+_cache_lock = threading.Lock()
+
+# Reused across warm invocations; overlaps Bedrock calls with DynamoDB reads
+_executor = ThreadPoolExecutor(max_workers=2)
+
 
 def _embed_text(text: str) -> list:
     """
@@ -21,7 +79,7 @@ def _embed_text(text: str) -> list:
     Returns an empty list if embedding is unavailable (graceful degradation).
     """
     try:
-        body = json.dumps({'inputText': text, 'dimensions': 256, 'normalize': True})
+        body = _EMBED_BODY_TEMPLATE % json.dumps(text)
         resp = bedrock_runtime.invoke_model(
             modelId=EMBEDDING_MODEL_ID,
             body=body,
@@ -34,16 +92,103 @@ def _embed_text(text: str) -> list:
         return []
 
 
-def _cosine_similarity(a: list, b: list) -> float:
-    """Cosine similarity between two equal-length vectors."""
-    if len(a) != len(b) or not a:
-        return 0.0
-    dot    = sum(x * y for x, y in zip(a, b))
-    norm_a = math.sqrt(sum(x * x for x in a))
-    norm_b = math.sqrt(sum(x * x for x in b))
-    if norm_a == 0 or norm_b == 0:
+def _embed_query(query: str) -> list:
+    """
+    Unit-length embedding of *query*, served from the LRU cache when the
+    same question (ignoring case and whitespace differences) was embedded
+    recently. Punctuation is kept since it can change meaning ("C" vs
+    "C++"). Failed embeddings are not cached.
+    """
+    key = hashlib.sha256(' '.join(query.casefold().split()).encode('utf-8')).digest()
+    now = time.monotonic()
+    with _cache_lock:
+        hit = _query_cache.get(key)
+        if hit and now - hit[0] < QUERY_CACHE_TTL:
+            _query_cache.move_to_end(key)
+            return hit[1]
+
+    embedding = _unit(_embed_text(query))
+    if embedding:
+        with _cache_lock:
+            _query_cache[key] = (now, embedding)
+            _query_cache.move_to_end(key)
+            if len(_query_cache) > QUERY_CACHE_SIZE:
+                _query_cache.popitem(last=False)
+    return embedding
+
+
+# Stored int8 embeddings: a float32 scale followed by one signed byte per
+# dimension (value = byte * scale)
+_INT8_SCALE  = struct.Struct('<f')
+_INT8_VALUES = struct.Struct('<%db' % EMBEDDING_DIMENSIONS)
+_FLOAT16     = struct.Struct('<%de' % EMBEDDING_DIMENSIONS)
+_FLOAT32     = struct.Struct('<%df' % EMBEDDING_DIMENSIONS)
+
+
+def _unpack_int8(data):
+    return array('b', data[_INT8_SCALE.size:]), _INT8_SCALE.unpack_from(data)[0]
+
+
+def _unpack_float16(data):
+    return array('f', _FLOAT16.unpack(data)), 1.0
+
+
+def _unpack_float32(data):
+    return array('f', _FLOAT32.unpack(data)), 1.0
+
+
+# Packed embedding layouts by byte length: int8 (current), then float16 and
+# float32 for chunks indexed before each switch
+_PACKED_EMBEDDING_UNPACKERS = {
+    _INT8_SCALE.size + _INT8_VALUES.size: _unpack_int8,
+    _FLOAT16.size:                        _unpack_float16,
+    _FLOAT32.size:                        _unpack_float32,
+}
+
+
+def _decode_embedding(raw):
+    """
+    Decode a stored chunk embedding into a (vector, scale) pair, where the
+    true vector is vector * scale and vector is a compact array.
+    Current chunks hold a scaled int8 Binary, copied straight into a signed
+    byte array (one byte per dimension) without materialising ints or
+    floats; older chunks hold packed float16/float32 bytes (scale 1.0) and
+    the oldest a JSON-encoded list. Returns an empty vector when the value
+    cannot be decoded.
+    """
+    if raw is None:
+        return array('b'), 1.0
+    if isinstance(raw, str):
+        try:
+            return array('f', json.loads(raw)), 1.0
+        except (ValueError, TypeError):
+            return array('b'), 1.0
+    data = getattr(raw, 'value', raw)  # boto3 wraps B attributes in Binary
+    unpack = _PACKED_EMBEDDING_UNPACKERS.get(len(data))
+    return unpack(data) if unpack else (array('b'), 1.0)
+
+
+if hasattr(math, 'sumprod'):
+    # Python 3.12+ (the Lambda runtime): a single C-level multiply-accumulate
+    _sumprod = math.sumprod
+else:
+    def _sumprod(a, b) -> float:
+        return sum(map(operator.mul, a, b))
+
+
+def _unit(vec) -> list:
+    """Scale *vec* to unit length; returns an empty list for a zero vector."""
+    norm = math.sqrt(_sumprod(vec, vec))
+    if norm == 0:
+        return []
+    return [x / norm for x in vec]
+
+
+def _dot(a, b) -> float:
+    """Dot product of two equal-length vectors (0.0 on length mismatch)."""
+    if len(a) != len(b):
         return 0.0
-    return dot / (norm_a * norm_b)
+    return _sumprod(a, b)
 
 
 def retrieve_context(user_id: str, query: str, top_k: int = RAG_TOP_K) -> list:
@@ -59,50 +204,209 @@ def retrieve_context(user_id: str, query: str, top_k: int = RAG_TOP_K) -> list:
     if not chunks_table:
         return []
 
-    query_embedding = _embed_text(query)
+    version = _chunks_version(user_id)
+    ranking = _cached_ranking_data(user_id, version)
+    # No status records means no documents: confirm there are no chunks
+    # before paying for a query embedding
+    if ranking is None and version == frozenset():
+        ranking = _load_ranking_data(user_id, version)
+    if ranking is not None and not ranking[2]:
+        return []
+
+    # The query embedding does not depend on the chunks, so embed on a
+    # worker thread while this thread pages through DynamoDB.
+    embedding_future = _executor.submit(_embed_query, query)
+
+    if ranking is None:
+        ranking = _load_ranking_data(user_id, version)
+    vectors, scales, items = ranking
+    if not items:
+        embedding_future.cancel()
+        return []
+
+    # Stored chunk vectors are unit length (Titan normalize=true), so cosine
+    # similarity reduces to a dot product once the query is normalised too.
+    query_embedding = embedding_future.result()
     if not query_embedding:
         return []
 
-    # Load all chunks for this user (pagination-aware)
-    chunks = []
-    last_key = None
-    while True:
-        kwargs = {
-            'KeyConditionExpression': (
-                boto3.dynamodb.conditions.Key('user_id').eq(user_id)
-            )
+    # Score every chunk in one pass; apply relevance threshold by index so
+    # no per-chunk records are built for the many chunks that lose
+    scores     = [_dot(query_embedding, vec) * scale for vec, scale in zip(vectors, scales)]
+    candidates = [i for i, score in enumerate(scores) if score >= RAG_SCORE_THRESHOLD]
+
+    # Select the top-k by descending score in O(N log k), and only build
+    # result dicts for the winners
+    best  = heapq.nlargest(top_k, candidates, key=scores.__getitem__)
+    texts = _fetch_chunk_texts(user_id, [items[i][0] for i in best])
+    # Winners without text (deleted since ranking, or still unprocessed
+    # after the last retry) are dropped rather than sent as empty sources
+    return [
+        {
+            'chunk_text':  texts[items[i][0]],
+            'filename':    items[i][1],
+            'chunk_index': items[i][2],
+            'score':       scores[i],
         }
-        if last_key:
-            kwargs['ExclusiveStartKey'] = last_key
-        response = chunks_table.query(**kwargs)
-        chunks.extend(response.get('Items', []))
-        last_key = response.get('LastEvaluatedKey')
-        if not last_key:
-            break
+        for i in best
+        if items[i][0] in texts
+    ]
+
+
+def _cached_ranking_data(user_id: str, version):
+    """
+    Return the cached (vectors, scales, items) for *user_id* if they were
+    loaded at *version* (see _chunks_version) within USER_CACHE_TTL, else
+    None.
+
+    Cached entries let a warm container answer follow-up questions with one
+    small status Query instead of paging through and decoding every chunk
+    again. Users with no chunks are cached the same way, so their turns
+    skip both the query embedding and the chunk Query until the token
+    changes (on any container, not just the one that served the upload)
+    or the entry expires.
+    """
+    if version is None:
+        return None
+    with _cache_lock:
+        cached = _user_chunks.get(user_id)
+        if (cached is None or cached[0] != version
+                or time.monotonic() - cached[1] >= USER_CACHE_TTL):
+            return None
+        _user_chunks.move_to_end(user_id)
+        return cached[2:]
+
+
+def _load_ranking_data(user_id: str, version) -> tuple[list, array, list]:
+    """
+    Query and decode every chunk of *user_id*, returning (vectors, scales,
+    items) in the same order: the embedding arrays, their scales, and
+    (chunk_id, filename, chunk_index) tuples. The result is cached under
+    *version* unless that is None.
+    """
+    global _user_chunks_total
+
+    loaded_at = time.monotonic()
+    vectors, scales, items = [], array('f'), []
+    filenames = {}   # one shared string per document instead of per chunk
+    # Decode each page while the next one is in flight
+    for page in _query_chunk_pages({
+        'KeyConditionExpression':    'user_id = :u',
+        'ExpressionAttributeValues': {':u': user_id},
+        # Ranking needs only the vectors; chunk_text is fetched for the
+        # top-k winners afterwards
+        'ProjectionExpression':      RANKING_PROJECTION,
+    }):
+        for item in page:
+            vector, scale = _decode_embedding(item.get('embedding'))
+            vectors.append(vector)
+            scales.append(scale)
+            filename = item.get('filename', '')
+            items.append((
+                item['chunk_id'],
+                filenames.setdefault(filename, filename),
+                int(item.get('chunk_index', 0)),
+            ))
+
+    if version is not None:
+        with _cache_lock:
+            previous = _user_chunks.pop(user_id, None)
+            if previous:
+                _user_chunks_total -= len(previous[-1])
+            # A user too large for the cache on their own is not cached,
+            # rather than flushing everyone else out for them
+            if len(items) <= USER_CACHE_MAX_CHUNKS:
+                _user_chunks[user_id] = (version, loaded_at, vectors, scales, items)
+                _user_chunks_total += len(items)
+            while _user_chunks and (len(_user_chunks) > USER_CACHE_SIZE
+                                    or _user_chunks_total > USER_CACHE_MAX_CHUNKS):
+                _, evicted = _user_chunks.popitem(last=False)
+                _user_chunks_total -= len(evicted[-1])
+    return vectors, scales, items
+
+
+def _chunks_version(user_id: str):
+    """
+    Version token for *user_id*'s indexed chunks, or None when it cannot be
+    read. The document processor writes a status record after a document's
+    chunks are stored and documents.py removes it on delete, so the set of
+    (doc_key, status, chunk_count, last_updated) values changes whenever
+    the chunks do.
+    """
+    if not doc_status_table:
+        return None
+    kwargs = {
+        'KeyConditionExpression':    'user_id = :u',
+        'ExpressionAttributeValues': {':u': user_id},
+        'ExpressionAttributeNames':  {'#s': 'status'},
+        'ProjectionExpression':      'doc_key, #s, chunk_count, last_updated',
+    }
+    try:
+        response = doc_status_table.query(**kwargs)
+        records  = response.get('Items', [])
+        while 'LastEvaluatedKey' in response:
+            response = doc_status_table.query(**kwargs, ExclusiveStartKey=response['LastEvaluatedKey'])
+            records.extend(response.get('Items', []))
+    except Exception as e:
+        print(f"Chunk version lookup error for {user_id} (non-fatal): {e}")
+        return None
+    return frozenset(
+        (r['doc_key'], r.get('status'), str(r.get('chunk_count')), r.get('last_updated'))
+        for r in records
+    )
 
-    if not chunks:
-        return []
 
-    # Score every chunk; apply relevance threshold
-    scored = []
-    for item in chunks:
+def _query_chunk_pages(kwargs: dict):
+    """
+    Yield the Items of each page of a chunks-table Query. The request for
+    the next page is issued on the executor before the current page is
+    handed back, so the caller's work on one page overlaps the round-trip
+    for the next. Only one request is in flight at a time.
+    """
+    response = chunks_table.query(**kwargs)
+    while True:
+        last_key = response.get('LastEvaluatedKey')
+        next_page = None
+        if last_key:
+            next_page = _executor.submit(chunks_table.query, **kwargs, ExclusiveStartKey=last_key)
         try:
-            stored_emb = json.loads(item.get('embedding', '[]'))
-        except (json.JSONDecodeError, TypeError):
-            continue
-        score = _cosine_similarity(query_embedding, stored_emb)
-        if score < RAG_SCORE_THRESHOLD:
-            continue
-        scored.append({
-            'chunk_text':  item.get('chunk_text', ''),
-            'filename':    item.get('filename', ''),
-            'chunk_index': int(item.get('chunk_index', 0)),
-            'score':       score,
-        })
-
-    # Return top-k by descending score
-    scored.sort(key=lambda x: x['score'], reverse=True)
-    return scored[:top_k]
+            yield response.get('Items', [])
+        except GeneratorExit:
+            if next_page is not None:
+                next_page.cancel()   # caller stopped early; drop it if not started
+            raise
+        if next_page is None:
+            return
+        response = next_page.result()
+
+
+def _fetch_chunk_texts(user_id: str, chunk_ids: list) -> dict:
+    """
+    Fetch chunk_text for the given chunk ids with BatchGetItem.
+    Returns {chunk_id: chunk_text}. Unprocessed keys are retried with
+    jittered exponential back-off for up to FETCH_MAX_ATTEMPTS requests in
+    total; ids still missing after that (or no longer stored) are left out.
+    """
+    if not chunk_ids:
+        return {}
+    request = {
+        chunks_table_name: {
+            'Keys': [{'user_id': user_id, 'chunk_id': cid} for cid in chunk_ids],
+            'ProjectionExpression': 'chunk_id, chunk_text',
+        }
+    }
+    texts = {}
+    for attempt in range(FETCH_MAX_ATTEMPTS):
+        if attempt:
+            time.sleep(random.uniform(0, min(FETCH_BACKOFF_MAX, FETCH_BACKOFF_BASE * 2 ** attempt)))
+        response = dynamodb.batch_get_item(RequestItems=request)
+        for item in response.get('Responses', {}).get(chunks_table_name, []):
+            texts[item['chunk_id']] = item.get('chunk_text', '')
+        request = response.get('UnprocessedKeys')
+        if not request:
+            return texts
+    print(f"Chunk text fetch for {user_id} gave up with unprocessed keys")
+    return texts
 
 
 def build_rag_prompt(user_message: str, context_chunks: list) -> str:
@@ -113,22 +417,20 @@ def build_rag_prompt(user_message: str, context_chunks: list) -> str:
     if not context_chunks:
         return user_message
 
-    context_parts = []
-    total_chars   = 0
+    # Every piece goes into one list joined once at the end. The document
+    # processor stores chunk_text already stripped, so it is used as-is.
+    parts       = [RAG_PREAMBLE]
+    total_chars = 0
     for chunk in context_chunks:
-        text = chunk['chunk_text'].strip()
-        if total_chars + len(text) > RAG_MAX_CHARS:
-            break
-        context_parts.append(
-            f"[Source: {chunk['filename']}, chunk {chunk['chunk_index']}]\n{text}"
-        )
+        text = chunk['chunk_text']
         total_chars += len(text)
+        if total_chars > RAG_MAX_CHARS:
+            break
+        if len(parts) > 1:
+            parts.append(RAG_CONTEXT_SEPARATOR)
+        parts.append(f"[Source: {chunk['filename']}, chunk {chunk['chunk_index']}]\n")
+        parts.append(text)
 
-    context_block = '\n\n---\n\n'.join(context_parts)
-    return (
-        f"Use the following excerpts from the user's documents to help answer "
-        f"their question. If the excerpts are not relevant, answer from your "
-        f"general knowledge instead.\n\n"
-        f"CONTEXT:\n{context_block}\n\n"
-        f"USER QUESTION:\n{user_message}"
-    )
+    parts.append('\n\nUSER QUESTION:\n')
+    parts.append(user_message)
+    return ''.join(parts)
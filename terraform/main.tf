@@ -198,10 +198,12 @@ resource "aws_lambda_function" "backend" {
   environment {
     variables = {
       BEDROCK_MODEL_ID       = var.bedrock_model_id
+      BEDROCK_LATENCY        = var.bedrock_latency
       USER_USAGE_TABLE       = aws_dynamodb_table.user_usage.name
       KNOWLEDGE_VAULT_BUCKET = aws_s3_bucket.knowledge_vault.bucket
       CHUNKS_TABLE           = aws_dynamodb_table.document_chunks.name
       DOCUMENT_STATUS_TABLE  = aws_dynamodb_table.document_status.name
+      LOG_LEVEL              = var.log_level
     }
   }
 }
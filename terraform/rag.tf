@@ -8,6 +8,8 @@
 #   4. S3 event notification – fires the processor on every object upload
 #   5. Updated IAM policy on the main chat Lambda adding Bedrock embedding
 #      permissions (so it can embed queries at search time)
+#   6. SNS topic Textract notifies when an async job finishes, subscribed by
+#      the processor Lambda (replaces in-Lambda polling)
 # =============================================================================
 
 # -----------------------------------------------------------------------------
@@ -71,6 +73,12 @@ resource "aws_iam_role_policy" "doc_processor_s3" {
         Effect   = "Allow"
         Action   = ["s3:GetObject", "s3:HeadObject"]
         Resource = "${aws_s3_bucket.knowledge_vault.arn}/*"
+      },
+      {
+        # Lets HeadObject on a deleted key return 404 rather than 403
+        Effect   = "Allow"
+        Action   = ["s3:ListBucket"]
+        Resource = aws_s3_bucket.knowledge_vault.arn
       }
     ]
   })
@@ -110,6 +118,21 @@ resource "aws_iam_role_policy" "doc_processor_textract" {
   })
 }
 
+# Let the processor hand Textract the role it publishes completion with
+resource "aws_iam_role_policy" "doc_processor_pass_textract_role" {
+  name = "doc_processor_pass_textract_role"
+  role = aws_iam_role.doc_processor_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [{
+      Effect   = "Allow"
+      Action   = ["iam:PassRole"]
+      Resource = aws_iam_role.textract_sns_role.arn
+    }]
+  })
+}
+
 # DynamoDB – write chunks and update processing status
 resource "aws_iam_role_policy" "doc_processor_dynamodb" {
   name = "doc_processor_dynamodb"
@@ -133,7 +156,8 @@ resource "aws_iam_role_policy" "doc_processor_dynamodb" {
         Action = [
           "dynamodb:PutItem",
           "dynamodb:UpdateItem",
-          "dynamodb:GetItem"
+          "dynamodb:GetItem",
+          "dynamodb:DeleteItem"
         ]
         Resource = aws_dynamodb_table.document_status.arn
       }
@@ -167,6 +191,8 @@ resource "aws_lambda_function" "document_processor" {
       CHUNKS_TABLE           = aws_dynamodb_table.document_chunks.name
       DOCUMENT_STATUS_TABLE  = aws_dynamodb_table.document_status.name
       KNOWLEDGE_VAULT_BUCKET = aws_s3_bucket.knowledge_vault.bucket
+      TEXTRACT_SNS_TOPIC_ARN = aws_sns_topic.textract_completion.arn
+      TEXTRACT_SNS_ROLE_ARN  = aws_iam_role.textract_sns_role.arn
       AWS_REGION_NAME        = var.aws_region
     }
   }
@@ -202,6 +228,60 @@ resource "aws_s3_bucket_notification" "vault_upload_trigger" {
   depends_on = [aws_lambda_permission.s3_invoke_processor]
 }
 
+# -----------------------------------------------------------------------------
+# 6. Textract completion notifications → Document Processor Lambda
+#    Async jobs (multi-page PDFs) publish here instead of being polled.
+# -----------------------------------------------------------------------------
+resource "aws_sns_topic" "textract_completion" {
+  name = "${var.project_name}-textract-completion"
+
+  tags = {
+    Project = var.project_name
+    Purpose = "Textract async job completion"
+  }
+}
+
+resource "aws_iam_role" "textract_sns_role" {
+  name = "${var.project_name}-textract-sns-role"
+
+  assume_role_policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [{
+      Action    = "sts:AssumeRole"
+      Effect    = "Allow"
+      Principal = { Service = "textract.amazonaws.com" }
+    }]
+  })
+}
+
+resource "aws_iam_role_policy" "textract_sns_publish" {
+  name = "textract_sns_publish"
+  role = aws_iam_role.textract_sns_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [{
+      Effect   = "Allow"
+      Action   = ["sns:Publish"]
+      Resource = aws_sns_topic.textract_completion.arn
+    }]
+  })
+}
+
+resource "aws_lambda_permission" "sns_invoke_processor" {
+  statement_id  = "AllowSNSInvoke"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.document_processor.function_name
+  principal     = "sns.amazonaws.com"
+  source_arn    = aws_sns_topic.textract_completion.arn
+}
+
+resource "aws_sns_topic_subscription" "textract_completion_processor" {
+  topic_arn = aws_sns_topic.textract_completion.arn
+  protocol  = "lambda"
+  endpoint  = aws_lambda_function.document_processor.arn
+}
+
 # -----------------------------------------------------------------------------
 # 5. Extra IAM – let the main chat Lambda call the embedding model
 #    (needed in Phase 2 to embed user queries at search time)
@@ -219,9 +299,9 @@ resource "aws_iam_role_policy" "chat_lambda_embedding" {
         Resource = "arn:aws:bedrock:${var.aws_region}::foundation-model/amazon.titan-embed-text-v2:0"
       },
       {
-        # RAG search: read all chunks for a user
+        # RAG search: rank all chunks for a user, then fetch the top-k texts
         Effect = "Allow"
-        Action = ["dynamodb:Query"]
+        Action = ["dynamodb:Query", "dynamodb:BatchGetItem"]
         Resource = aws_dynamodb_table.document_chunks.arn
       },
       {
@@ -13,6 +13,11 @@ variable "bedrock_model_id" {
   default     = "amazon.nova-lite-v1:0"
 }
 
+variable "bedrock_latency" {
+  description = "Bedrock inference latency mode for the chat model: optimized (used only where the model supports it) or standard"
+  default     = "optimized"
+}
+
 variable "domain_name" {
   description = "Custom domain name (e.g., example.com) for CloudFront"
   default     = ""
@@ -22,3 +27,8 @@ variable "certificate_arn" {
   description = "ACM Certificate ARN for the custom domain (must be in us-east-1)"
   default     = ""
 }
+
+variable "log_level" {
+  description = "Backend log level; DEBUG also logs full request events"
+  default     = "INFO"
+}
@@ -0,0 +1,137 @@
+"""
+Tests for backend/rag.py retrieval, run against in-memory fakes of
+the DynamoDB tables and the Titan embedding call.
+
+Run from the repository root:  python -m unittest discover tests
+"""
+import json
+import os
+import sys
+import unittest
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('CHUNKS_TABLE', 'test-chunks')
+os.environ.setdefault('DOCUMENT_STATUS_TABLE', 'test-status')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import rag  # noqa: E402
+
+
+class FakeTable:
+    """Counts Query calls and returns a fixed item list in one page."""
+
+    def __init__(self, items=()):
+        self.items   = list(items)
+        self.queries = 0
+
+    def query(self, **kwargs):
+        self.queries += 1
+        return {'Items': [dict(item) for item in self.items]}
+
+
+class RetrieveContextTest(unittest.TestCase):
+
+    def setUp(self):
+        self.chunks = FakeTable()
+        self.status = FakeTable()
+        self.embeds = 0
+
+        def fake_embed(text):
+            self.embeds += 1
+            return [1.0] * rag.EMBEDDING_DIMENSIONS
+
+        patches = {
+            'chunks_table':     self.chunks,
+            'doc_status_table': self.status,
+            '_embed_text':      fake_embed,
+        }
+        for name, value in patches.items():
+            original = getattr(rag, name)
+            setattr(rag, name, value)
+            self.addCleanup(setattr, rag, name, original)
+        with rag._cache_lock:
+            rag._user_chunks.clear()
+            rag._user_chunks_total = 0
+            rag._query_cache.clear()
+
+    def test_empty_user_skips_embedding(self):
+        for question in ('first question', 'second question'):
+            self.assertEqual(rag.retrieve_context('nobody', question), [])
+
+        # The first turn pages the chunk table once; the cached empty entry
+        # then answers the second turn. Neither turn embeds the query.
+        self.assertEqual(self.embeds, 0)
+        self.assertEqual(self.chunks.queries, 1)
+        self.assertEqual(self.status.queries, 2)
+
+    def test_new_status_record_invalidates_empty_entry(self):
+        self.assertEqual(rag.retrieve_context('u', 'question'), [])
+        self.status.items.append({
+            'doc_key': 'u/notes.txt', 'status': 'indexed',
+            'chunk_count': 1, 'last_updated': 't1',
+        })
+        rag.retrieve_context('u', 'question')
+        self.assertEqual(self.chunks.queries, 2)
+
+    def test_cached_entry_expires_without_status_change(self):
+        # A failed status write leaves the token unchanged; the TTL still
+        # forces the chunks to be read again
+        original = rag.USER_CACHE_TTL
+        rag.USER_CACHE_TTL = 0
+        self.addCleanup(setattr, rag, 'USER_CACHE_TTL', original)
+        for _ in range(2):
+            rag.retrieve_context('nobody', 'question')
+        self.assertEqual(self.chunks.queries, 2)
+
+    def test_winners_without_text_are_dropped(self):
+        vector = json.dumps([1 / 16] * rag.EMBEDDING_DIMENSIONS)
+        self.chunks.items = [
+            {'chunk_id': f'u/notes.txt#{i:05d}', 'filename': 'notes.txt',
+             'chunk_index': i, 'embedding': vector}
+            for i in range(2)
+        ]
+        self.status.items = [{
+            'doc_key': 'u/notes.txt', 'status': 'indexed',
+            'chunk_count': 2, 'last_updated': 't1',
+        }]
+        # Chunk 1 was deleted after the ranking data was cached
+        self.patch_batch_get(lambda keys: ({'u/notes.txt#00000': 'kept'}, None))
+
+        results = rag.retrieve_context('u', 'question')
+        self.assertEqual([r['chunk_text'] for r in results], ['kept'])
+
+    def test_unprocessed_keys_retry_is_bounded(self):
+        calls = []
+
+        def throttled(keys):
+            calls.append(keys)
+            return {}, keys
+
+        self.patch_batch_get(throttled)
+        self.assertEqual(rag._fetch_chunk_texts('u', ['u/a.txt#00000']), {})
+        self.assertEqual(len(calls), rag.FETCH_MAX_ATTEMPTS)
+
+    def patch_batch_get(self, respond):
+        """
+        Route BatchGetItem to *respond*(keys) -> (texts by chunk id,
+        unprocessed keys or None), with retry back-off disabled.
+        """
+        def batch_get_item(RequestItems):
+            (table_name, request), = RequestItems.items()
+            texts, unprocessed = respond(request['Keys'])
+            response = {'Responses': {table_name: [
+                {'chunk_id': cid, 'chunk_text': text} for cid, text in texts.items()
+            ]}}
+            if unprocessed:
+                response['UnprocessedKeys'] = {table_name: dict(request, Keys=unprocessed)}
+            return response
+
+        fake_dynamodb = type('FakeDynamoDB', (), {'batch_get_item': staticmethod(batch_get_item)})
+        for name, value in (('dynamodb', fake_dynamodb), ('FETCH_BACKOFF_BASE', 0)):
+            original = getattr(rag, name)
+            setattr(rag, name, value)
+            self.addCleanup(setattr, rag, name, original)
+
+
+if __name__ == '__main__':
+    unittest.main()
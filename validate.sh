@@ -25,6 +25,9 @@ if [ -d "backend" ]; then
     # check syntax using python -m py_compile
     echo "Checking Python syntax in backend/..."
     python -m py_compile backend/*.py
+
+    echo "Running backend unit tests..."
+    python -m unittest discover tests
 else
     echo "No backend directory found."
 fi